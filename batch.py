@@ -0,0 +1,115 @@
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import gus2molden
+import no2molden
+import vb2molden
+from compress import Strip
+
+# input file of every kind of conversion, the job name is its stem
+EXTENSION = {'vb': '.orb', 'gus': '.xdat', 'no': '.xmo'}
+
+
+def Convert(kind, job):
+    # runs in a worker; the workers live for the whole batch, so jobs on the
+    # same basis set reuse the cached AO permutation of cart.MoldenOrder
+    start = time.perf_counter()
+    try:
+        if kind == 'vb':
+            vb2molden.WriteMolden(job, job)
+        elif kind == 'gus':
+            gus2molden.WriteMolden(job, job)
+        else:
+            # the xmvb.no next to the .xmo
+            no2molden.WriteMolden(
+                job, os.path.join(os.path.dirname(job), 'xmvb.no'))
+    except Exception as e:
+        return job, time.perf_counter() - start, f'{type(e).__name__}: {e}'
+    return job, time.perf_counter() - start, None
+
+
+def FindJobs(kind, args):
+    # file names, glob patterns or @list files holding one of them per line
+    jobs = []
+    for arg in args:
+        if arg.startswith('@'):
+            with open(arg[1:]) as file:
+                jobs.extend(FindJobs(kind, [line.strip() for line in file
+                                            if line.strip()]))
+            continue
+        for name in sorted(glob.glob(arg)) or [arg]:
+            stem, extension = os.path.splitext(Strip(name))
+            jobs.append(stem if extension == EXTENSION[kind] else name)
+    return list(dict.fromkeys(jobs))
+
+
+def Isolated(kind, job):
+    # a job of a broken pool runs again in a pool of its own, so that only
+    # the job whose worker dies is reported
+    with ProcessPoolExecutor(1) as pool:
+        try:
+            return pool.submit(Convert, kind, job).result()
+        except Exception as e:
+            return job, 0.0, f'{type(e).__name__}: {e}'
+
+
+def Collect(pool, kind, jobs):
+    # results as they finish; a worker that dies (killed by the OOM killer,
+    # say) breaks the pool, the jobs it took down are run again one by one
+    futures = {pool.submit(Convert, kind, job): job for job in jobs}
+    broken = []
+    for future in as_completed(futures):
+        try:
+            yield future.result()
+        except BrokenProcessPool:
+            broken.append(futures[future])
+        except Exception as e:
+            yield futures[future], 0.0, f'{type(e).__name__}: {e}'
+    for job in broken:
+        yield Isolated(kind, job)
+
+
+def RunBatch(kind, jobs, workers=None):
+    failed = []
+    start = time.perf_counter()
+    pool = None
+    if workers == 1:
+        results = (Convert(kind, job) for job in jobs)
+    else:
+        pool = ProcessPoolExecutor(workers)
+        results = Collect(pool, kind, jobs)
+
+    try:
+        for job, elapsed, error in results:
+            if error is None:
+                print(f'{elapsed:>8.2f}s  {job}')
+            else:
+                print(f'{elapsed:>8.2f}s  {job}  FAILED  {error}')
+                failed.append(job)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(f'{len(jobs) - len(failed)}/{len(jobs)} jobs converted in '
+          f'{time.perf_counter() - start:.2f}s')
+    for job in failed:
+        print(f'failed: {job}')
+    return failed
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    workers = None
+    if '-j' in args:
+        k = args.index('-j')
+        workers = int(args[k + 1])
+        del args[k:k + 2]
+    if not args or args[0] not in EXTENSION:
+        raise ValueError(
+            'usage: python batch.py vb|gus|no [-j workers] <jobs...>')
+
+    failed = RunBatch(args[0], FindJobs(args[0], args[1:]), workers)
+    sys.exit(1 if failed else 0)
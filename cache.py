@@ -0,0 +1,170 @@
+import hashlib
+import os
+
+import numpy as np
+
+from compress import Find
+from orb import Sparse
+from xmo import Molecule
+
+# XMVB_CACHE=1 keeps <input>.<reader>.npz next to the inputs,
+# XMVB_CACHE=<directory> keeps them in one directory, where the least
+# recently used ones are removed beyond XMVB_CACHE_SIZE megabytes
+LIMIT = 1024
+
+
+def Digest(filename):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def CachePath(filename, tag, directory):
+    if directory is None:
+        return f'{filename}.{tag}.npz'
+    name = hashlib.blake2b(os.path.abspath(filename).encode(),
+                           digest_size=8).hexdigest()
+    return os.path.join(directory, f'{tag}-{name}.npz')
+
+
+def Pack(result):
+    if isinstance(result, np.ndarray):
+        return {'matrix': result}
+    if isinstance(result, Sparse):
+        return {'shape': result.shape, 'indptr': result.indptr,
+                'indices': result.indices, 'data': result.data}
+    if isinstance(result, dict):
+        return {'index_keys': np.array(list(result), dtype='U16'),
+                'index_values': np.array(list(result.values()), dtype=int)}
+    if isinstance(result, tuple):
+        return {f'item{k}': item for k, item in enumerate(result)}
+    return {
+        'natm': result.natm, 'n': result.n, 'geo': result.geo,
+        'basis': result.basis, 'unit': result.unit,
+        'atoms': np.array([a for a, _ in result.shells], dtype=int),
+        'types': np.array([t for _, t in result.shells], dtype='U1'),
+        'charges': np.array(result.charges, dtype=float),
+        'coords': np.array(result.coords, dtype=float).reshape(-1, 3),
+        'prim_counts': np.array([len(p) for p in result.primitives],
+                                dtype=int),
+        'prims': np.array([row + [np.nan] * (3 - len(row))
+                           for p in result.primitives for row in p],
+                          dtype=float).reshape(-1, 3),
+        'offset_keys': np.array(list(result.offsets), dtype='U16'),
+        'offset_values': np.array(list(result.offsets.values()), dtype=int)}
+
+
+def Unpack(data):
+    if 'matrix' in data:
+        return data['matrix']
+    if 'indptr' in data:
+        return Sparse(tuple(data['shape'].tolist()), data['indptr'],
+                      data['indices'], data['data'])
+    if 'index_keys' in data:
+        return dict(zip(data['index_keys'].tolist(),
+                        data['index_values'].tolist()))
+    if 'item0' in data:
+        return tuple(data[f'item{k}'] for k in range(len(data)))
+    mol = Molecule()
+    mol.natm = int(data['natm'])
+    mol.n = int(data['n'])
+    mol.geo = str(data['geo'])
+    mol.basis = str(data['basis'])
+    mol.unit = str(data['unit'])
+    mol.shells = list(zip(data['atoms'].tolist(), data['types'].tolist()))
+    mol.charges = data['charges'].tolist()
+    mol.coords = data['coords'].tolist()
+    prims = np.split(data['prims'], np.cumsum(data['prim_counts'])[:-1])
+    mol.primitives = [[row[:3 if t == 'L' else 2] for row in p.tolist()]
+                      for p, (_, t) in zip(prims, mol.shells)]
+    mol.offsets = dict(zip(data['offset_keys'].tolist(),
+                           data['offset_values'].tolist()))
+    return mol
+
+
+def Evict(directory, limit, keep):
+    # modification times are refreshed on every hit, the oldest go first;
+    # keep, the entry just written, stays even when it alone is too large.
+    # Other processes may evict at the same time, vanished files are skipped
+    files = []
+    for name in os.listdir(directory):
+        if not name.endswith('.npz'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime_ns, stat.st_size, path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= limit or path == keep:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def Cached(reader, filename, *args):
+    # reader(filename, *args), or its result stored by an earlier run; the
+    # entry is valid while the input has the same size and modification
+    # time, or else the same content hash; a compressed input is found
+    # under the plain name and keyed by its compressed bytes
+    filename = Find(filename)
+    setting = os.environ.get('XMVB_CACHE', '')
+    if not setting:
+        return reader(filename, *args)
+    directory = None if setting == '1' else setting
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    # the arguments are part of the name, the dense and the sparse reading
+    # of one input are kept side by side
+    path = CachePath(filename, '-'.join(
+        [reader.__name__] + [str(arg) for arg in args]), directory)
+    stat = os.stat(filename)
+    key = repr(args)
+    digest = None
+    try:
+        with np.load(path) as data:
+            if str(data['key']) == key and \
+                    int(data['size']) == stat.st_size:
+                if int(data['mtime']) != stat.st_mtime_ns:
+                    digest = Digest(filename)
+                if digest is None or str(data['digest']) == digest:
+                    result = Unpack({name: data[name] for name in data.files
+                                     if name not in (
+                                         'key', 'size', 'mtime', 'digest')})
+                    os.utime(path)
+                    return result
+    except Exception:
+        # missing, truncated (zipfile.BadZipFile) or foreign entries are
+        # read again and replaced
+        pass
+
+    # the fingerprint is taken before reading, an input that changes in
+    # between is read again next time
+    digest = digest or Digest(filename)
+    result = reader(filename, *args)
+    # written next to the entry and moved into place, an interrupted write
+    # never leaves a broken entry behind
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            np.savez_compressed(file, key=key, size=stat.st_size,
+                                mtime=stat.st_mtime_ns, digest=digest,
+                                **Pack(result))
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    if directory is not None:
+        Evict(directory, float(os.environ.get(
+            'XMVB_CACHE_SIZE', LIMIT)) * 2 ** 20, path)
+    return result
@@ -0,0 +1,91 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+
+ANGULAR = {'S': 0, 'P': 1, 'D': 2, 'F': 3, 'G': 4, 'H': 5, 'I': 6}
+
+# Cartesian components in Molden order, the format stops at G; higher
+# shells are written in XMVB order
+MOLDEN = {
+    2: 'XX YY ZZ XY XZ YZ',
+    3: 'XXX YYY ZZZ XYY XXY XXZ XZZ YZZ YYZ XYZ',
+    4: 'XXXX YYYY ZZZZ XXXY XXXZ YYYX YYYZ ZZZX ZZZY XXYY XXZZ YYZZ XXYZ '
+       'YYXZ ZZXY',
+}
+
+
+def XmvbComponents(l):
+    # libcint order: x powers descending, then y powers descending
+    return [(lx, ly, l - lx - ly)
+            for lx in range(l, -1, -1)
+            for ly in range(l - lx, -1, -1)]
+
+
+@lru_cache(maxsize=None)
+def ShellOrder(l):
+    # position in the XMVB order of every Molden component of one shell
+    xmvb = XmvbComponents(l)
+    if l not in MOLDEN:
+        return list(range(len(xmvb)))
+    return [xmvb.index((c.count('X'), c.count('Y'), c.count('Z')))
+            for c in MOLDEN[l].split()]
+
+
+def ShellSizes(types):
+    # number of Cartesian functions of every shell, an L shell holds S and P
+    return [4 if t == 'L' else (ANGULAR[t] + 1) * (ANGULAR[t] + 2) // 2
+            for t in types]
+
+
+@lru_cache(maxsize=None)
+def MoldenOrder(types):
+    # row i of a Molden coefficient matrix is row order[i] of the XMVB one;
+    # types is a tuple of shell letters, cached so that jobs on the same
+    # basis set share one index array
+    order = []
+    for orbital_type in types:
+        start = len(order)
+        if orbital_type == 'L':
+            order.extend(range(start, start + 4))
+        else:
+            order.extend(start + i for i in ShellOrder(ANGULAR[orbital_type]))
+    order = np.array(order, dtype=np.intp)
+    order.flags.writeable = False
+    return order
+
+
+@lru_cache(maxsize=None)
+def XmvbOrder(types):
+    # inverse of MoldenOrder: row i of an XMVB matrix is row order[i] of
+    # the Molden one
+    order = np.argsort(MoldenOrder(types))
+    order.flags.writeable = False
+    return order
+
+
+@lru_cache(maxsize=None)
+def MoldenScale(types):
+    # Molden files normalize every Cartesian function, libcint (pyscf,
+    # XMVB with int=libcint) normalizes the radial part only, so that the
+    # function x^a y^b z^c of a shell of l >= 2 has the self-overlap
+    # 4 pi (2a-1)!! (2b-1)!! (2c-1)!! / (2l+1)!!; row i of a Molden matrix
+    # divided by scale[i] gives the libcint coefficients
+    scale = []
+    for orbital_type in types:
+        if orbital_type in ('S', 'P', 'L'):
+            scale.extend([1.0] * ShellSizes([orbital_type])[0])
+            continue
+        l = ANGULAR[orbital_type]
+        components = XmvbComponents(l)
+        for i in ShellOrder(l):
+            scale.append(math.sqrt(4 * math.pi * math.prod(
+                DoubleFactorial(2 * k - 1) for k in components[i]) /
+                DoubleFactorial(2 * l + 1)))
+    scale = np.array(scale)
+    scale.flags.writeable = False
+    return scale
+
+
+def DoubleFactorial(n):
+    return math.prod(range(n, 0, -2))
@@ -0,0 +1,94 @@
+import gzip
+import io
+import os
+
+# compressed inputs are recognized by their first bytes, compressed
+# outputs get one of these extensions; zstd needs the optional zstandard
+# package
+MAGIC = {b'\x1f\x8b': 'gz', b'\x28\xb5\x2f\xfd': 'zst'}
+EXTENSIONS = ('.gz', '.zst')
+
+
+def Find(filename):
+    # filename, or else filename.gz or filename.zst, so that the scripts
+    # take compressed inputs under their usual names
+    if not os.path.exists(filename):
+        for extension in EXTENSIONS:
+            if os.path.exists(filename + extension):
+                return filename + extension
+    return filename
+
+
+def Strip(filename):
+    # filename without a compression extension
+    for extension in EXTENSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+
+def Kind(filename):
+    # 'gz', 'zst' or None for a plain file
+    with open(filename, 'rb') as file:
+        head = file.read(4)
+    return MAGIC.get(head[:2]) or MAGIC.get(head)
+
+
+def Zstandard(filename):
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(f'{filename}: zstd files need the zstandard package')
+    return zstandard
+
+
+class Forward(io.RawIOBase):
+    # a zstd stream reader as a raw file for io.BufferedReader: the reader
+    # seeks forward by decompressing but calls itself not seekable
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.reader.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.reader.seek(offset, whence)
+
+    def tell(self):
+        return self.reader.tell()
+
+    def close(self):
+        self.reader.close()
+        super().close()
+
+
+def Open(filename):
+    # binary reader decompressing on the fly; lines, forward seeks and
+    # tell() work as on a plain file, nothing is written to disk
+    filename = Find(filename)
+    kind = Kind(filename)
+    if kind == 'gz':
+        return gzip.open(filename, 'rb')
+    if kind == 'zst':
+        reader = Zstandard(filename).ZstdDecompressor().stream_reader(
+            open(filename, 'rb'), closefd=True)
+        return io.BufferedReader(Forward(reader), 1 << 20)
+    return open(filename, 'rb')
+
+
+def Create(filename, compress=None):
+    # text writer for filename, or for filename.gz / filename.zst
+    if compress == 'gz':
+        return gzip.open(f'{filename}.gz', 'wt', compresslevel=6)
+    if compress == 'zst':
+        return Zstandard(filename).open(f'{filename}.zst', 'wt')
+    if compress is not None:
+        raise ValueError(f'unknown compression {compress}, use gz or zst')
+    return open(filename, 'w')
@@ -0,0 +1,100 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cache import Cached
+from gto import EvalAO, Shells
+from molden2gus import ParseInp
+from orb import ReadOrb
+from xmo import ReadXmo
+
+# points per block, about 32 MB of AO values whatever the basis size
+BLOCK = 2 ** 22
+
+# the shells and the selected orbitals of a worker, set once by Setup
+state = {}
+
+
+def Setup(shells, c):
+    state['shells'] = shells
+    state['c'] = c
+
+
+def EvalBlock(points):
+    # AO values of the block once, all orbitals with one matrix product
+    return EvalAO(state['shells'], points) @ state['c']
+
+
+def Grid(coords, spacing, margin):
+    # box around the atoms, counts rounded up to whole spacings (bohr)
+    coords = np.asarray(coords, dtype=float)
+    origin = coords.min(axis=0) - margin
+    counts = np.ceil((coords.max(axis=0) + margin - origin) /
+                     spacing).astype(int) + 1
+    return origin, counts
+
+
+def WriteCube(filename, mol, origin, counts, spacing, values, title):
+    with open(filename, 'w') as file:
+        file.write(f'{title}\nOUTER LOOP: X, MIDDLE LOOP: Y, INNER LOOP: Z\n')
+        file.write('%5d%12.6f%12.6f%12.6f\n' % (mol.natm, *origin))
+        for axis in range(3):
+            step = [0.0, 0.0, 0.0]
+            step[axis] = spacing
+            file.write('%5d%12.6f%12.6f%12.6f\n' % (counts[axis], *step))
+        for charge, xyz in zip(mol.charges, mol.coords):
+            file.write('%5d%12.6f%12.6f%12.6f%12.6f\n' % (
+                round(charge), charge, *xyz))
+
+        # every (x, y) column of z values starts on a new line, six per line
+        full, rest = divmod(counts[2], 6)
+        line = ('%13.5E' * 6 + '\n') * full + \
+            ('%13.5E' * rest + '\n' if rest else '')
+        file.write(''.join(line % tuple(column) for column in
+                           values.reshape(-1, counts[2]).tolist()))
+
+
+def WriteCubes(file, file2, orbitals, spacing=0.2, margin=4.0, workers=None):
+    xmo = Cached(ReadXmo, f'{file2}.xmo')
+    matrix = Cached(ReadOrb, f'{file}.orb', xmo.n, False)
+    cols = [k - 1 for k in orbitals]
+    if min(cols) < 0 or max(cols) >= matrix.shape[1]:
+        raise ValueError(f'{file}.orb has {matrix.shape[1]} orbitals')
+
+    origin, counts = Grid(xmo.coords, spacing, margin)
+    axes = [origin[k] + spacing * np.arange(counts[k]) for k in range(3)]
+    points = np.stack(np.meshgrid(*axes, indexing='ij'), -1).reshape(-1, 3)
+    size = max(BLOCK // xmo.n, 1)
+    blocks = [points[i:i + size] for i in range(0, len(points), size)]
+
+    shells = Shells(xmo)
+    c = matrix[:, cols]
+    if workers == 1 or len(blocks) == 1:
+        Setup(shells, c)
+        values = np.vstack([EvalBlock(block) for block in blocks])
+    else:
+        with ProcessPoolExecutor(workers, initializer=Setup,
+                                 initargs=(shells, c)) as pool:
+            values = np.vstack(list(pool.map(EvalBlock, blocks)))
+
+    for k, orbital in enumerate(orbitals):
+        WriteCube(f'{file}_{orbital}.cube', xmo, origin, counts, spacing,
+                  values[:, k], f'{file}.orb orbital {orbital}')
+        print(f'{file}_{orbital}.cube has been written')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {'--spacing': 0.2, '--margin': 4.0, '-j': None}
+    for name in options:
+        if name in args:
+            k = args.index(name)
+            options[name] = float(args[k + 1])
+            del args[k:k + 2]
+    if len(args) != 3:
+        raise ValueError('usage: python cube.py <.orb> <.xmo> <orbitals> '
+                         '[--spacing 0.2] [--margin 4.0] [-j workers]')
+    workers = options['-j'] and int(options['-j'])
+    WriteCubes(args[0], args[1], ParseInp(args[2]), options['--spacing'],
+               options['--margin'], workers)
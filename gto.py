@@ -0,0 +1,264 @@
+import math
+
+import numpy as np
+
+from cart import ANGULAR, XmvbComponents
+from orb import Sparse
+
+
+def Norm(l, exponents):
+    # radial normalization of a primitive, as in libcint
+    return np.sqrt(2 ** (2 * l + 3) * math.factorial(l + 1) *
+                   (2 * exponents) ** (l + 1.5) /
+                   (math.factorial(2 * l + 2) * math.sqrt(math.pi)))
+
+
+# the Molden order of the Cartesian components as the format defines it,
+# kept apart from cart.MOLDEN that the writers permute with so that the
+# norm check sees a wrong permutation; higher shells are written in XMVB
+# order
+MOLDEN_COMPONENTS = {
+    2: [(2, 0, 0), (0, 2, 0), (0, 0, 2), (1, 1, 0), (1, 0, 1), (0, 1, 1)],
+    3: [(3, 0, 0), (0, 3, 0), (0, 0, 3), (1, 2, 0), (2, 1, 0), (2, 0, 1),
+        (1, 0, 2), (0, 1, 2), (0, 2, 1), (1, 1, 1)],
+    4: [(4, 0, 0), (0, 4, 0), (0, 0, 4), (3, 1, 0), (3, 0, 1), (1, 3, 0),
+        (0, 3, 1), (1, 0, 3), (0, 1, 3), (2, 2, 0), (2, 0, 2), (0, 2, 2),
+        (2, 1, 1), (1, 2, 1), (1, 1, 2)],
+}
+
+
+def MoldenComponents(l):
+    return MOLDEN_COMPONENTS.get(l) or XmvbComponents(l)
+
+
+# libcint also keeps the angular normalization of s and p functions
+# (CINTcommon_fac_sp), higher Cartesian functions go without it
+COMMON = {0: 0.5 / math.sqrt(math.pi), 1: 0.5 * math.sqrt(3 / math.pi)}
+
+
+def GaussianInt(n, alpha):
+    # integral of r^n exp(-alpha r^2) from 0 to infinity
+    return math.gamma((n + 1) / 2) / (2 * alpha ** ((n + 1) / 2))
+
+
+def Shells(mol):
+    # contracted shells (atom, center, l, exponents, coefficients) in the
+    # XMVB basis order, an L shell gives an S and a P shell; the
+    # coefficients hold the primitive normalization and the contraction is
+    # normalized as libcint does with int=libcint
+    shells = []
+    for (atom, orbital_type), rows in zip(mol.shells, mol.primitives):
+        rows = np.array(rows, dtype=float)
+        exponents = rows[:, 0]
+        if orbital_type == 'L':
+            parts = [(0, rows[:, 1]), (1, rows[:, 2])]
+        else:
+            parts = [(ANGULAR[orbital_type], rows[:, 1])]
+        for l, coefficients in parts:
+            coefficients = coefficients * Norm(l, exponents)
+            overlap = GaussianInt(
+                2 * l + 2, exponents[:, None] + exponents[None, :])
+            coefficients = coefficients / np.sqrt(
+                coefficients @ overlap @ coefficients) * COMMON.get(l, 1.0)
+            shells.append((atom, np.array(mol.coords[atom - 1]), l,
+                           exponents, coefficients))
+    return shells
+
+
+def EvalAO(shells, points):
+    # values of all basis functions at points (npts x 3); the distances,
+    # their powers and products are computed once per atom, the
+    # exponentials once per set of exponents on an atom
+    n = sum((l + 1) * (l + 2) // 2 for _, _, l, _, _ in shells)
+    # filled one basis function per row, contiguous, and returned transposed
+    values = np.empty((n, len(points)))
+    last = None
+    i = 0
+    for atom, center, l, exponents, coefficients in shells:
+        if atom != last:
+            last = atom
+            d = points - center
+            r2 = np.einsum('ij,ij->i', d, d)
+            powers = [[np.ones(len(points))] for _ in range(3)]
+            gaussians = {}
+            angular = {}
+        for axis in range(3):
+            while len(powers[axis]) <= l:
+                powers[axis].append(powers[axis][-1] * d[:, axis])
+        key = exponents.tobytes()
+        if key not in gaussians:
+            gaussians[key] = np.exp(-np.outer(r2, exponents))
+        radial = gaussians[key] @ coefficients
+        for a, b, c in XmvbComponents(l):
+            if (a, b, c) not in angular:
+                angular[a, b, c] = powers[0][a] * powers[1][b] * powers[2][c]
+            np.multiply(radial, angular[a, b, c], out=values[i])
+            i += 1
+    return values.T
+
+
+def Transfer(la, lb, pa, ab, p):
+    # 1D Obara-Saika overlap tables [i][j] (i <= la, j <= lb) without the
+    # s-type prefactor: the recursion raises i up to la + lb, the
+    # horizontal transfer S(i, j+1) = S(i+1, j) + (A - B) S(i, j) moves
+    # it over to j
+    half = 0.5 / p
+    rows = [np.ones_like(pa), pa]
+    for k in range(1, la + lb):
+        rows.append(pa * rows[k] + k * half * rows[k - 1])
+    table = [rows[:la + lb + 1]]
+    for j in range(lb):
+        table.append([table[j][i + 1] + ab * table[j][i]
+                      for i in range(la + lb - j)])
+    return [[table[j][i] for j in range(lb + 1)] for i in range(la + 1)]
+
+
+def Padded(shells, members):
+    # the shells members (indices into shells) by angular momentum, the
+    # primitives padded to the same count: {l: (first AO of every shell,
+    # centers, exponents, coefficients, smallest exponents)} and the number
+    # of AOs; AOs are counted over members in their order
+    offsets = np.cumsum([0] + [(shells[k][2] + 1) * (shells[k][2] + 2) // 2
+                               for k in members])
+    groups = {}
+    for position, k in enumerate(members):
+        groups.setdefault(shells[k][2], []).append((position, k))
+    padded = {}
+    for l, items in groups.items():
+        width = max(len(shells[k][3]) for _, k in items)
+        exponents = np.ones((len(items), width))
+        coefficients = np.zeros((len(items), width))
+        for row, (_, k) in enumerate(items):
+            exponents[row, :len(shells[k][3])] = shells[k][3]
+            coefficients[row, :len(shells[k][4])] = shells[k][4]
+        padded[l] = (offsets[[position for position, _ in items]],
+                     np.array([shells[k][1] for _, k in items]).reshape(-1, 3),
+                     exponents, coefficients,
+                     np.array([shells[k][3].min() for _, k in items]))
+    return padded, offsets[-1]
+
+
+def Overlap(shells, rows=None, cols=None, cutoff=1e-16,
+            components=XmvbComponents):
+    # AO overlap block between the shells rows and cols (indices into
+    # shells, all of them by default), the Cartesian functions of a shell
+    # in the order of components(l), XMVB by default; the shell pairs of
+    # every pair of angular momenta are done together on padded primitive
+    # arrays, and pairs whose most diffuse primitives overlap less than
+    # cutoff are skipped
+    rows = range(len(shells)) if rows is None else rows
+    cols = range(len(shells)) if cols is None else cols
+    padded_a, n_rows = Padded(shells, rows)
+    padded_b, n_cols = Padded(shells, cols)
+    s = np.zeros((n_rows, n_cols))
+
+    for la, (first_a, centers_a, exps_a, coefs_a, min_a) in padded_a.items():
+        for lb, (first_b, centers_b, exps_b, coefs_b, min_b) in \
+                padded_b.items():
+            ia, ib = np.meshgrid(np.arange(len(first_a)),
+                                 np.arange(len(first_b)), indexing='ij')
+            ia, ib = ia.ravel(), ib.ravel()
+            ab = centers_a[ia] - centers_b[ib]
+            r2 = np.einsum('ij,ij->i', ab, ab)
+            mu = min_a[ia] * min_b[ib] / (min_a[ia] + min_b[ib])
+            keep = mu * r2 < -np.log(cutoff)
+            ia, ib = ia[keep], ib[keep]
+
+            components_a = components(la)
+            components_b = components(lb)
+            # pairs per chunk, about 2**22 numbers in every table entry
+            size = max(2 ** 22 // (exps_a.shape[1] * exps_b.shape[1]), 1)
+            for start in range(0, len(ia), size):
+                pa_index = ia[start:start + size]
+                pb_index = ib[start:start + size]
+                a = exps_a[pa_index][:, :, None]
+                b = exps_b[pb_index][:, None, :]
+                p = a + b
+                ab = (centers_a[pa_index] - centers_b[pb_index])[:, None,
+                                                                 None, :]
+                weight = coefs_a[pa_index][:, :, None] * \
+                    coefs_b[pb_index][:, None, :] * (np.pi / p) ** 1.5 * \
+                    np.exp(-a * b / p * np.einsum('...i,...i', ab, ab))
+                pa = (-b / p)[..., None] * ab
+                table = Transfer(la, lb, pa, ab, (p[..., None]))
+                block = np.empty((len(pa_index), len(components_a),
+                                  len(components_b)))
+                for i, (ax, ay, az) in enumerate(components_a):
+                    for j, (bx, by, bz) in enumerate(components_b):
+                        block[:, i, j] = np.einsum(
+                            'pab,pab,pab,pab->p', weight,
+                            table[ax][bx][..., 0], table[ay][by][..., 1],
+                            table[az][bz][..., 2])
+                s[first_a[pa_index][:, None, None] +
+                  np.arange(len(components_a))[None, :, None],
+                  first_b[pb_index][:, None, None] +
+                  np.arange(len(components_b))[None, None, :]] = block
+    return s
+
+
+def Norms(shells, matrix, order=None, components=XmvbComponents):
+    # diag(C^T S C) of the orbitals in the columns of a dense or orb.Sparse
+    # matrix. With order the orbitals are checked as written: row i of C is
+    # row order[i] of matrix and the functions of a shell are in the order
+    # of components(l). The columns go in chunks of about 2**22 numbers,
+    # and S is never held whole: it is built in panels of about as many
+    # numbers, the rows of a few shells against the shells that carry
+    # coefficients, and every panel is one matrix product with C
+    offsets = np.cumsum([0] + [(l + 1) * (l + 2) // 2
+                               for _, _, l, _, _ in shells])
+    n, m = matrix.shape
+    size = max(2 ** 22 // n, 1)
+    norms = [np.empty(0)]
+    for i in range(0, m, size):
+        j = min(i + size, m)
+        if isinstance(matrix, Sparse):
+            a, b = matrix.indptr[i], matrix.indptr[j]
+            c = np.zeros((n, j - i))
+            c[matrix.indices[a:b], np.repeat(
+                np.arange(j - i), np.diff(matrix.indptr[i:j + 1]))] = \
+                matrix.data[a:b]
+        else:
+            c = matrix[:, i:j]
+        if order is not None:
+            c = c[order]
+        norms.append(PanelNorms(shells, offsets, c, components))
+    return np.concatenate(norms)
+
+
+def PanelNorms(shells, offsets, c, components):
+    owner = np.repeat(np.arange(len(shells)), np.diff(offsets))
+    active = np.unique(owner[np.flatnonzero(np.any(c != 0, axis=1))])
+    norms = np.zeros(c.shape[1])
+    if not len(active):
+        return norms
+    c = c[np.concatenate([np.arange(offsets[k], offsets[k + 1])
+                          for k in active])]
+    # consecutive active shells make a panel of at most limit AOs
+    sizes = offsets[active + 1] - offsets[active]
+    ends = np.cumsum(sizes)
+    limit = max(2 ** 22 // len(c), sizes.max())
+    panel = []
+    start = 0
+    for k, end in enumerate(ends):
+        panel.append(active[k])
+        if k + 1 == len(ends) or ends[k + 1] - start > limit:
+            s = Overlap(shells, panel, active, components=components)
+            norms += np.einsum('ij,ij->j', c[start:end], s @ c)
+            panel = []
+            start = end
+    return norms
+
+
+def CheckNorms(filename, norms, tolerance=1e-4):
+    # a norm far from 1 usually means the D/F components of the orbitals
+    # are not in the order of the basis; empty orbitals are left out
+    written = np.flatnonzero(norms)
+    if not len(written):
+        return
+    bad = written[np.abs(norms[written] - 1) > tolerance]
+    print(f'{filename}: norms of {len(written)} orbitals between '
+          f'{norms[written].min():.6f} and {norms[written].max():.6f}')
+    if len(bad):
+        print(f'{filename}: orbitals not normalized: ' + ' '.join(
+            f'{k + 1}({norms[k]:.4f})' for k in bad[:20]) +
+            (' ...' if len(bad) > 20 else ''))
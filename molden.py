@@ -0,0 +1,231 @@
+import re
+
+import numpy as np
+
+from cart import MoldenScale, ShellSizes
+from compress import Open
+from orb import ParseNumbers, Sparse
+from xmo import Molecule
+
+SECTION = re.compile(rb'^[ \t]*\[([^\]\n]*)\]([^\n]*)\n?', re.M)
+KEY = re.compile(rb'^[ \t]*(Sym|Ene|Spin|Occup)[ \t]*=([^\n]*)\n?', re.M | re.I)
+SHELL = {'s': 'S', 'p': 'P', 'd': 'D', 'f': 'F', 'g': 'G', 'h': 'H',
+         'i': 'I', 'sp': 'L'}
+SPHERICAL = {b'5D', b'7F', b'9G', b'5D7F', b'5D10F'}
+
+# AO lines: the fixed layout by default, with compact=True the bare index
+# and 7 significant digits, switching to an exponent for small values
+INDEX = {False: '%4d  ', True: '%d '}
+NUMBER = {False: '%15.10f', True: '%.7G'}
+
+
+def WriteHeader(mol, xmo):
+    mol.write('''[Molden Format]
+[Title]
+qaq
+''')
+    mol.write(f'[Atoms] {xmo.unit}\n')
+    mol.write(xmo.geo)
+    mol.write('[GTO]')
+    mol.write(xmo.basis)
+    mol.write('\n' * 3)
+    mol.write('''[6D10F]\n[MO]\n''')
+
+
+def Heads(occup, start, count):
+    head = '''Sym=     1a
+Ene= 1.0
+Spin= Alpha
+'''
+    if occup is None:
+        return [head + 'Occup= 2.000000\n'] * count
+    return [head + f'Occup= {occ:>15.10f}\n'
+            for occ in occup[start:start + count]]
+
+
+def Lines(n, compact):
+    # the AO line of every row with its index filled in, only the
+    # coefficient is left to format
+    return np.array([INDEX[compact] % (j + 1) + NUMBER[compact] + '\n'
+                     for j in range(n)], dtype=object)
+
+
+def SparseOrbitals(heads, lines, indices, data, indptr, start=0):
+    # heads followed by the listed AOs of orbitals start, start + 1, ...
+    out = []
+    for col, head in enumerate(heads, start):
+        a, b = indptr[col], indptr[col + 1]
+        out.append(head + ''.join(lines[indices[a:b]].tolist()) %
+                   tuple(data[a:b].tolist()))
+    return ''.join(out)
+
+
+def WriteMO(mol, matrix, occup=None, order=None, chunk=64, pad=0, drop=0.0,
+            compact=False):
+    # one format string holds a whole orbital, so every orbital is a single
+    # %-formatting call and every chunk of orbitals a single write; rows are
+    # taken in the given AO order while formatting, the matrix is not copied;
+    # pad empty orbitals follow for programs that expect a square set.
+    # With drop the AOs below it are left out, chunk by chunk
+    n, m = matrix.shape
+    lines = Lines(n, compact)
+    body = ''.join(lines)
+    for i in range(0, m, chunk):
+        columns = matrix[:, i:i + chunk] if order is None else \
+            matrix[order, i:i + chunk]
+        heads = Heads(occup, i, columns.shape[1])
+        if drop:
+            columns = Sparse.FromDense(columns).Drop(drop)
+            mol.write(SparseOrbitals(heads, lines, columns.indices,
+                                     columns.data, columns.indptr))
+            continue
+        columns = columns.T.tolist()
+        mol.write(''.join(h + body % tuple(c) for h, c in zip(
+            heads, columns)))
+    zero = Heads(None if occup is None else [0.0], 0, 1)[0]
+    if not drop:
+        zero += body % ((0.0,) * n)
+    for _ in range(pad):
+        mol.write(zero)
+
+
+def WriteMOSparse(mol, matrix, occup=None, order=None, chunk=64, pad=0,
+                  drop=0.0, compact=False):
+    # orb.Sparse input, only the nonzero AOs of every orbital are listed
+    if order is not None:
+        matrix = matrix.Permute(order)
+    if drop:
+        matrix = matrix.Drop(drop)
+    m = matrix.shape[1]
+    lines = Lines(matrix.shape[0], compact)
+    for i in range(0, m, chunk):
+        heads = Heads(occup, i, min(chunk, m - i))
+        mol.write(SparseOrbitals(heads, lines, matrix.indices, matrix.data,
+                                 matrix.indptr, i))
+    if pad:
+        mol.write(Heads(None if occup is None else [0.0], 0, 1)[0] * pad)
+
+
+def WriteMOStream(mol, columns, n, order=None, total=0, drop=0.0,
+                  compact=False):
+    # columns yields (column, coefficients) in ascending order, one
+    # orbital is held at a time; skipped orbitals and those up to total
+    # are written empty
+    lines = Lines(n, compact)
+    body = ''.join(lines)
+    head = Heads(None, 0, 1)[0]
+    zero = head if drop else head + body % ((0.0,) * n)
+    count = 0
+    for col, vector in columns:
+        if col < count:
+            raise ValueError(f'Orbital {col + 1} is out of order, '
+                             'orbitals can only be streamed in order')
+        for _ in range(col - count):
+            mol.write(zero)
+        vector = vector if order is None else vector[order]
+        if drop:
+            rows = np.flatnonzero(np.abs(vector) >= drop)
+            mol.write(head + ''.join(lines[rows].tolist()) %
+                      tuple(vector[rows].tolist()))
+        else:
+            mol.write(head + body % tuple(vector.tolist()))
+        count = col + 1
+    for _ in range(total - count):
+        mol.write(zero)
+
+
+def ReadGTO(text, mol):
+    # [GTO]: '<atom> 0', then '<shell> <primitives> 1.00' followed by the
+    # primitives; the text is kept as it is for the _gus.molden header
+    lines = text.splitlines()
+    atom_index = 0
+    i = 0
+    while i < len(lines):
+        parts = lines[i].split()
+        i += 1
+        if not parts:
+            continue
+        if parts[0].isdigit():
+            atom_index += 1
+        elif parts[0].lower() in SHELL and len(parts) > 1:
+            mol.shells.append((atom_index, SHELL[parts[0].lower()]))
+            i += int(parts[1])
+        else:
+            raise ValueError(f'Unknown line in [GTO]: {lines[i - 1]}')
+    mol.basis = '\n' + text.strip('\n') + '\n'
+
+
+def ReadMO(data, start, end, n):
+    # [MO]: every orbital is a group of 'Key= value' lines followed by
+    # 'ao coefficient' lines; the coefficient blocks of all orbitals are
+    # parsed together and scattered into the matrix in one go
+    spans = []
+    occup = []
+    # a repeated key starts the next orbital even without coefficients
+    last = None
+    keys = set()
+    for match in KEY.finditer(data, start, end):
+        key = match.group(1).lower()
+        if last is None or match.start() != last or key in keys:
+            spans.append([match.end(), end])
+            occup.append(2.0)
+            keys = set()
+            if len(spans) > 1:
+                spans[-2][1] = match.start()
+        else:
+            spans[-1][0] = match.end()
+        keys.add(key)
+        if key == b'occup':
+            occup[-1] = float(match.group(2).replace(b'D', b'E')
+                              .replace(b'd', b'e'))
+        last = match.end()
+
+    # Fortran writers may use D exponents
+    text = data[:end].translate(bytes.maketrans(b'Dd', b'Ee'))
+    pairs = ParseNumbers(text, spans)
+    cols = np.repeat(np.arange(len(pairs)), [len(p) // 2 for p in pairs])
+    pairs = np.concatenate(pairs + [np.empty(0)])
+    rows = pairs[0::2].astype(np.intp) - 1
+    matrix = np.zeros((max(n, rows.max() + 1 if len(rows) else 0),
+                       len(spans)))
+    matrix[rows, cols] = pairs[1::2]
+    return matrix, np.array(occup)
+
+
+def ReadMolden(filename):
+    # atoms, shells and MO coefficients of a Cartesian Molden file, the
+    # coefficients are kept in Molden order and are rescaled to the libcint
+    # normalization of the Cartesian functions, as pyscf reads them
+    with Open(filename) as file:
+        data = file.read()
+
+    mol = Molecule()
+    sections = list(SECTION.finditer(data))
+    matrix = occup = None
+    for k, match in enumerate(sections):
+        name = match.group(1).strip().upper()
+        start = match.end()
+        end = sections[k + 1].start() if k + 1 < len(sections) else len(data)
+        if name == b'ATOMS':
+            mol.unit = match.group(2).decode().strip() or 'AU'
+            geo = [line for line in data[start:end].decode().splitlines()
+                   if line.strip()]
+            mol.natm = len(geo)
+            mol.geo = ''.join(f'{line}\n' for line in geo)
+        elif name == b'GTO':
+            ReadGTO(data[start:end].decode(), mol)
+            mol.n = sum(ShellSizes(t for _, t in mol.shells))
+        elif name in SPHERICAL:
+            raise ValueError(
+                f'{filename}: spherical functions [{name.decode()}] '
+                'are not supported')
+        elif name == b'MO':
+            matrix, occup = ReadMO(data, start, end, mol.n)
+
+    if matrix is None:
+        raise ValueError(f'{filename}: no [MO] section')
+    if matrix.shape[0] != mol.n:
+        raise ValueError(f'{filename}: [MO] has {matrix.shape[0]} basis '
+                         f'functions, [GTO] has {mol.n}')
+    matrix /= MoldenScale(tuple(t for _, t in mol.shells))[:, None]
+    return mol, matrix, occup
@@ -1,157 +1,62 @@
 import sys
 
 import numpy as np
-from pyscf.tools.molden import *
 
-
-def _parse_mo(lines, envs):
-    mol = envs['mol']
-    if not mol._built:
-        try:
-            mol.build(0, 0)
-        except RuntimeError:
-            mol.build(0, 0, spin=1)
-
-    irrep_labels = []
-    mo_energy = []
-    spins = []
-    mo_occ = []
-    mo_coeff_prim = []  # primary data, will be reworked for missing values
-    coeff_idx = []
-    mo_id = 0
-    for line in lines[1:]:
-        line = line.upper()
-        if 'SYM' in line:
-            irrep_labels.append(line.split('=')[1].strip())
-        elif 'ENE' in line:
-            mo_energy.append(float(_d2e(line).split('=')[1].strip()))
-            mo_id = len(mo_energy) - 1
-        elif 'SPIN' in line:
-            spins.append(line.split('=')[1].strip())
-        elif 'OCC' in line:
-            mo_occ.append(float(_d2e(line.split('=')[1].strip())))
-        else:
-            ao_id, c = line.split()[:2]
-            coeff_idx.append([int(ao_id) - 1, mo_id])
-            mo_coeff_prim.append(float(c))
-
-    coeff_idx = np.array(coeff_idx)
-    number_of_aos, number_of_mos = coeff_idx.max(axis=0) + 1
-    mo_coeff = np.zeros([number_of_aos, number_of_mos])
-    mo_coeff[coeff_idx[:, 0], coeff_idx[:, 1]] = mo_coeff_prim
-
-    mo_energy = np.array(mo_energy)
-    mo_occ = np.array(mo_occ)
-
-    return mol, mo_energy, mo_coeff, mo_occ, irrep_labels, spins
-
-
-def orbital_coeff(mol, fout, mo_coeff, spin='Alpha', symm=None, ene=None,
-                  occ=None, ignore_h=IGNORE_H):
-    from pyscf.symm import label_orb_symm
-
-    if ignore_h:
-        mol, mo_coeff = remove_high_l(mol, mo_coeff)
-
-    nmo = mo_coeff.shape[1]
-    if symm is None:
-        symm = ['A']*nmo
-        if mol.symmetry:
-            try:
-                symm = label_orb_symm(mol, mol.irrep_name, mol.symm_orb,
-                                      mo_coeff, tol=1e-5)
-            except ValueError as e:
-                logger.warn(mol, str(e))
-    if ene is None or len(ene) != nmo:
-        ene = np.arange(nmo)
-    assert (spin == 'Alpha' or spin == 'Beta')
-    if occ is None:
-        occ = np.zeros(nmo)
-        neleca, nelecb = mol.nelec
-        if spin == 'Alpha':
-            occ[:neleca] = 1
-        else:
-            occ[:nelecb] = 1
-
-    if spin == 'Alpha':
-        # Avoid duplicated [MO] session when dumping beta orbitals
-        fout.write('[MO]\n')
-
-    for imo in range(nmo):
-        fout.write(' Sym= %s\n' % symm[imo])
-        fout.write(' Ene= %15.10g\n' % ene[imo])
-        fout.write(' Spin= %s\n' % spin)
-        fout.write(' Occup= %10.5f\n' % occ[imo])
-        for i in mo_coeff.shape[1]:
-            fout.write(' %3d    %18.14g\n' % (i+1, mo_coeff[i]))
-
-
-def ExtractRows(matrix, atoms, column_index, position):
-
-    result = np.zeros((matrix.shape[0], 1))
-
-    atom_start = np.hstack((0, position[:-1]))
-
-    for atom in atoms:
-        atom -= 1
-        start = atom_start[atom]
-        end = position[atom]
-        result[start:end, 0] = matrix[start:end, column_index]
-
-    return result
-
-
-def ChangeDi(matrix, i):
-    temp = matrix[i + 1:i + 6, :].copy()
-    matrix[i + 1, :] = temp[2, :]  # YY 0  XY i+1
-    matrix[i + 2, :] = temp[3, :]  # ZZ 1  XZ
-    matrix[i + 3, :] = temp[0, :]  # XY 2  YY
-    matrix[i + 4, :] = temp[4, :]  # XZ 3  YZ
-    matrix[i + 5, :] = temp[1, :]  # YZ 4  ZZ
-    return matrix
-
-
-def ChangeFi(matrix, i):
-    temp = matrix[i + 1:i + 10,].copy()
-    matrix[i + 1, :] = temp[3, :]  # YYY 0  XXY i+1
-    matrix[i + 2, :] = temp[4, :]  # ZZZ 1  XXZ
-    # XYY 2  XYY
-    matrix[i + 4, :] = temp[8, :]  # XXY 3  XYZ
-    matrix[i + 5, :] = temp[5, :]  # XXZ 4  XZZ
-    matrix[i + 6, :] = temp[0, :]  # XZZ 5  YYY
-    matrix[i + 7, :] = temp[7, :]  # YZZ 6  YYZ
-    matrix[i + 8, :] = temp[6, :]  # YYZ 7  YZZ
-    matrix[i + 9, :] = temp[1, :]  # XYZ 8  ZZZ
-    return matrix
+from cart import MoldenScale, ShellSizes, XmvbOrder
+from compress import Create, Find, Kind
+from molden import ReadMolden, WriteHeader, WriteMO
+from orb import Sparse
+
+
+def CheckPyscf(filename, mol, c):
+    # optional cross-check of ReadMolden against pyscf.tools.molden, which
+    # reorders the AOs; both give the libcint normalization
+    try:
+        from pyscf.tools.molden import load, order_ao_index
+    except ImportError:
+        print('pyscf is not installed, cross-check skipped')
+        return
+    if Kind(filename) is not None:
+        print('pyscf cannot read compressed files, cross-check skipped')
+        return
+    ref, _, mo_coeff = load(filename)[:3]
+    if isinstance(mo_coeff, tuple):
+        mo_coeff = np.hstack(mo_coeff)
+    mo_coeff = mo_coeff[order_ao_index(ref)]
+    if ref.natm != mol.natm or mo_coeff.shape != c.shape:
+        raise ValueError(f'pyscf reads {ref.natm} atoms and '
+                         f'{mo_coeff.shape} coefficients, '
+                         f'expected {mol.natm} and {c.shape}')
+    print(f'pyscf cross-check: max deviation '
+          f'{np.abs(mo_coeff - c).max():.3e}')
+
+
+def AtomMask(atoms, position):
+    # True for the rows of the basis functions centred on the given atoms
+    owner = np.repeat(np.arange(len(position)), np.diff(position, prepend=0))
+    return np.isin(owner, np.asarray(atoms) - 1)
 
 
 def Write(filename, matrix):
-    counts = []
-    details = []
-
-    for col in range(matrix.shape[1]):
-        col_data = matrix[:, col]
-        non_zeros = np.nonzero(col_data)[0]
-        non_zero_values = col_data[non_zeros]
-
-        counts.append(len(non_zero_values))
-
-        data = [f'# ORBITAL{col + 1:>11}']
-        for i in range(0, len(non_zero_values), 4):
-            line = ''.join(
-                f'{non_zero_values[i + j]:>13.10f} {non_zeros[i + j] + 1:>5}  '
-                for j in range(4)
-                if i + j < len(non_zero_values)
-            )
-            data.append(line)
-        details.append(data)
+    # dense or orb.Sparse input, the nonzero coefficients of every orbital
+    # are written as 'value index' pairs, four to a line
+    if not isinstance(matrix, Sparse):
+        matrix = Sparse.FromDense(matrix)
+    indptr = matrix.indptr.tolist()
+    rows = (matrix.indices + 1).tolist()
+    data = matrix.data.tolist()
 
     with open(filename, 'w') as file:
-        file.write(''.join(f'   {i}' for i in counts) + '\n')
+        file.write(''.join(f'   {i}' for i in np.diff(indptr)) + '\n')
 
-        for data in details:
-            for line in data:
-                file.write(line + '\n')
+        for col in range(matrix.shape[1]):
+            a, b = indptr[col], indptr[col + 1]
+            full, rest = divmod(b - a, 4)
+            pairs = [x for pair in zip(data[a:b], rows[a:b]) for x in pair]
+            file.write(f'# ORBITAL{col + 1:>11}\n' + (
+                ('%13.10f %5d  ' * 4 + '\n') * full +
+                ('%13.10f %5d  ' * rest + '\n' if rest else '')) %
+                tuple(pairs))
 
 
 def Rotate(matrix, angle, col1, clo2):
@@ -175,22 +80,149 @@ def ParseInp(str):
     return result
 
 
-def main(filename):
-    a = read(f'{filename}.molden')
-    natm = a[0].natm
-    c = a[2]
+def ParseCommand(inp, natm, col_len):
+    # one command of the input loop or of a --script file
+    if inp.lower() == 'q':
+        return ('q',)
+    elif inp.lower().startswith('r'):
+        angle, cols = inp.split()
+        angle = float(angle[1:])
+        cols = [int(x) - 1 for x in cols.split(',')]
+        if len(cols) != 2 or max(cols) >= col_len or min(cols) < 0:
+            raise ValueError('Invalid number')
+        return ('r', angle, cols[0], cols[1])
+    elif inp.lower().startswith('m'):
+        num = float(inp.split()[0][1:])
+        col = int(inp.split()[1]) - 1
+        if col >= col_len or col < 0:
+            raise ValueError('Invalid number')
+        return ('m', num, col)
+    elif inp.lower().startswith('a'):
+        cols = [x - 1 for x in ParseInp(inp.split()[1])]
+        if max(cols) >= col_len or min(cols) < 0:
+            raise ValueError('Invalid number')
+        return ('a', None, cols)
+    else:
+        atoms, cols = inp.split()
+        atoms = sorted(list(ParseInp(atoms)))
+        cols = [x - 1 for x in ParseInp(cols)]
+        if atoms[-1] > natm or max(
+                cols) >= col_len or atoms[0] < 1 or min(cols) < 0:
+            raise ValueError('Invalid number')
+        return ('s', atoms, cols)
+
+
+def ReadScript(filename, natm, col_len):
+    # every line is checked before anything runs; blank lines and '#'
+    # comments are skipped and 'q' ends the script
+    commands = []
+    errors = []
+    with open(filename) as file:
+        for number, line in enumerate(file, 1):
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            try:
+                command = ParseCommand(line, natm, col_len)
+            except (ValueError, IndexError) as e:
+                errors.append(f'{filename}:{number}: {line}: {e}')
+                continue
+            if command[0] == 'q':
+                break
+            commands.append(command)
+    if errors:
+        raise ValueError('\n'.join(errors))
+    return commands
+
+
+def CompilePlan(commands):
+    # a run of rotations and scalings becomes one matrix over the columns
+    # it touches, the selections that follow it are gathered together:
+    # [(touched, transform, cols, atoms of every col or None), ...]
+    plan = []
+    for command in commands:
+        if command[0] in 'rm':
+            if not plan or plan[-1][2]:
+                plan.append(([], [], [], []))
+            plan[-1][1].append(command)
+        else:
+            if not plan:
+                plan.append(([], [], [], []))
+            plan[-1][2].extend(command[2])
+            plan[-1][3].extend([command[1]] * len(command[2]))
+
+    compiled = []
+    for _, steps, cols, atoms in plan:
+        touched = sorted({i for step in steps for i in (
+            step[2:] if step[0] == 'r' else step[2:3])})
+        index = {col: k for k, col in enumerate(touched)}
+        transform = np.eye(len(touched))
+        for step in steps:
+            if step[0] == 'r':
+                angle = np.deg2rad(step[1])
+                pair = [index[step[2]], index[step[3]]]
+                transform[:, pair] = transform[:, pair] @ np.array(
+                    [[np.cos(angle), -np.sin(angle)],
+                     [np.sin(angle), np.cos(angle)]])
+            else:
+                transform[:, index[step[2]]] *= step[1]
+        compiled.append((touched, transform, cols, atoms))
+    return compiled
+
+
+def RunPlan(c, plan, position):
+    blocks = [np.empty((c.shape[0], 0))]
+    for touched, transform, cols, atoms in plan:
+        if touched:
+            c[:, touched] = c[:, touched] @ transform
+        if not cols:
+            continue
+        masks = {None: np.ones(c.shape[0], dtype=bool)}
+        for atom_list in atoms:
+            key = atom_list and tuple(atom_list)
+            if key not in masks:
+                masks[key] = AtomMask(atom_list, position)
+        mask = np.column_stack(
+            [masks[atom_list and tuple(atom_list)] for atom_list in atoms])
+        blocks.append(np.where(mask, c[:, cols], 0))
+    return np.hstack(blocks)
+
+
+def WriteGuess(filename, mol, result, types, drop=0.0, compact=False,
+               compress=None):
+    # only the _gus.molden is compressed, XMVB reads the .gus as it is;
+    # the _gus.molden gets the Molden normalization back, the .gus keeps
+    # the libcint one that XMVB uses with int=libcint
+    with Create(f'{filename}_gus.molden', compress) as file:
+        WriteHeader(file, mol)
+        WriteMO(file, result * MoldenScale(types)[:, None], drop=drop,
+                compact=compact)
+
+    Write(f'{filename}.gus', result[XmvbOrder(types)])
+    print(f'{filename}.gus has been written')
+
+
+def main(filename, check=False, script=None, drop=0.0, compact=False,
+         compress=None):
+    mol, c, _ = ReadMolden(f'{filename}.molden')
+    if check:
+        CheckPyscf(Find(f'{filename}.molden'), mol, c)
+    natm = mol.natm
     row_len, col_len = c.shape
-    count = 0
-    basis_type = [(i[0] + 1) * (i[0] + 2) // 2
-                for key in a[0]._basis.values()
-                for i in key]
-
-    position = np.cumsum([
-        sum((i[0] + 1) * (i[0] + 2) // 2
-            for i in key)
-        for key in a[0]._basis.values()
-    ])
-    result = np.empty((row_len, 0))
+    types = tuple(t for _, t in mol.shells)
+
+    # last row + 1 of every atom, atoms counted in [GTO] order
+    position = np.cumsum(np.bincount(
+        [atom for atom, _ in mol.shells], ShellSizes(types))[1:]).astype(int)
+
+    if script is not None:
+        plan = CompilePlan(ReadScript(script, natm, col_len))
+        WriteGuess(filename, mol, RunPlan(c, plan, position), types, drop,
+                   compact, compress)
+        return
+
+    # guess orbitals are collected as column blocks and stacked once at 'q'
+    blocks = [np.empty((row_len, 0))]
     while True:
         inp = input('''Please input atom numbers and orbital numbers
 for example: 2,4 6-8,9
@@ -199,58 +231,37 @@ Input \'r<angle> <col1>,<col2>\' to rotate two orbitals
 Input \'m<num> <col>\' to multip orbital by <num>
 Input \'q\' to write and exit\n''')
         try:
-            if inp.lower() == 'q':
-                from_mo(a[0], f'{filename}_gus.molden', result)
-
-                for i in basis_type:
-                    if i == 6:
-                        ChangeDi(result, count)
-                    elif i == 10:
-                        ChangeFi(result, count)
-                    count += i
-
-                Write(f'{filename}.gus', result)
-                print(f'{filename}.gus has been written')
-
+            command = ParseCommand(inp, natm, col_len)
+            if command[0] == 'q':
+                WriteGuess(filename, mol, np.hstack(blocks), types, drop,
+                           compact, compress)
                 break
-            elif inp.lower().startswith('r'):
-                angle, cols = inp.split()
-                angle = float(angle[1:])
-                cols = [int(x) - 1 for x in cols.split(',')]
-                if len(cols) != 2 or max(cols) >= col_len or min(cols) < 0:
-                    raise ValueError('Invalid number')
-                c = Rotate(c, angle, cols[0], cols[1])
+            elif command[0] == 'r':
+                _, angle, col1, col2 = command
+                c = Rotate(c, angle, col1, col2)
                 print(
-                    f'Orbital {cols[0]+1} and Orbital {cols[1]+1} have been rotated by {angle} degrees'
+                    f'Orbital {col1+1} and Orbital {col2+1} have been rotated by {angle} degrees'
                 )
-            elif inp.lower().startswith('m'):
-                num = float(inp.split()[0][1:])
-                col = int(inp.split()[1]) - 1
-                if col >= col_len or col < 0:
-                    raise ValueError('Invalid number')
+            elif command[0] == 'm':
+                _, num, col = command
                 c[:, col] *= num
                 print(f'Orbital {col+1} has been multiplied by {num}')
-            elif inp.lower().startswith('a'):
-                cols = [x - 1 for x in ParseInp(inp.split()[1])]
-                if max(cols) >= col_len or min(cols) < 0:
-                    raise ValueError('Invalid number')
-                for col in cols:
-                    result = np.hstack(
-                        (result, c[:, col].reshape(-1, 1)))
+            elif command[0] == 'a':
+                blocks.append(c[:, command[2]])
             else:
-                atoms, cols = inp.split()
-                atoms = sorted(list(ParseInp(atoms)))
-                cols = [x - 1 for x in ParseInp(cols)]
-                if atoms[-1] > natm or max(
-                        cols) >= col_len or atoms[0] < 1 or min(cols) < 0:
-                    raise ValueError('Invalid number')
-                for col in cols:
-                    result = np.hstack(
-                        (result, ExtractRows(c, atoms, col, position)))
+                _, atoms, cols = command
+                mask = AtomMask(atoms, position)
+                blocks.append(np.where(mask[:, None], c[:, cols], 0))
         except ValueError as e:
             print(e)
 
 
 if __name__ == '__main__':
-
-    main(sys.argv[1])
+    args = sys.argv[1:]
+    script = args[args.index('--script') + 1] if '--script' in args else None
+    drop = float(args[args.index('--drop-below') + 1]) \
+        if '--drop-below' in args else 0.0
+    compress = args[args.index('--compress') + 1] \
+        if '--compress' in args else None
+    main(args[0], '--check' in args, script, drop, '--compact' in args,
+         compress)
@@ -0,0 +1,266 @@
+import numpy as np
+
+from compress import Open
+
+
+def ParseFixed(lines):
+    # lines: one row per text line (newline included), all sharing the same
+    # layout of right-aligned numeric fields as written by Fortran F/I edit
+    # descriptors.  The layout is checked column by column and the digits
+    # are summed with matrix products instead of converting every token;
+    # None is returned when the lines do not share a fixed layout.
+    lo = lines.min(axis=0)
+    hi = lines.max(axis=0)
+    blank = hi <= 32
+    digit = (lo >= 48) & (hi <= 57)
+    point = (lo == 46) & (hi == 46)
+
+    # a field is a run of columns that are not blank in every line: leading
+    # columns may hold blanks or a sign, the rest are digits and one point
+    fields = []
+    run = []
+    for j in range(lines.shape[1] + 1):
+        if j < lines.shape[1] and not blank[j]:
+            run.append(j)
+            continue
+        if not run:
+            continue
+        fixed = digit[run] | point[run]
+        start = np.argmax(fixed) if fixed.any() else len(run)
+        if start == len(run) or not fixed[start:].all() or \
+                point[run].sum() > 1 or not digit[run[-1]] or \
+                len(run) - point[run].sum() > 15:
+            return None
+        fields.append((run[:start], run[start:]))
+        run = []
+
+    mixed = [j for head, _ in fields for j in head]
+    # inside the leading columns a line must go from blanks to a sign or
+    # digits and stay there, with the sign only in front
+    left = np.array([k for k in range(len(mixed) - 1)
+                     if mixed[k + 1] == mixed[k] + 1], dtype=np.intp)
+    first = np.cumsum([0] + [len(head) for head, _ in fields])
+
+    # integer weight of every digit, the decimal point is applied
+    # afterwards so that every value is rounded only once
+    weight = np.zeros((lines.shape[1], len(fields)))
+    scale = np.ones(len(fields))
+    for k, (head, tail) in enumerate(fields):
+        exponent = 0
+        for j in reversed(head + tail):
+            if point[j]:
+                scale[k] = 10.0 ** exponent
+                continue
+            weight[j, k] = 10.0 ** exponent
+            exponent += 1
+    weight_head = weight[mixed]
+    weight[mixed] = 0
+
+    values = np.empty((lines.shape[0], len(fields)))
+    for i in range(0, lines.shape[0], 16384):
+        chunk = lines[i:i + 16384]
+        head = chunk[:, mixed]
+        digits = head - 48
+        isdigit = digits < 10
+        nonblank = head > 32
+        minus = head == 45
+        if not (isdigit | ~nonblank | minus).all() or \
+                (nonblank[:, left] & ~nonblank[:, left + 1]).any() or \
+                (minus[:, left + 1] & nonblank[:, left]).any():
+            return None
+        block = (chunk - 48).astype(np.float64) @ weight
+        block += (digits * isdigit) @ weight_head
+        block /= scale
+        for k in range(len(fields)):
+            if first[k] < first[k + 1]:
+                block[minus[:, first[k]:first[k + 1]].any(axis=1), k] *= -1
+        values[i:i + 16384] = block
+
+    return values
+
+
+def ParseNumbers(data, spans):
+    # numbers of data[start:end] for every (start, end) in spans; the lines
+    # sharing the width of the first line are parsed together by ParseFixed,
+    # whatever is left (short last lines, other layouts) is tokenized by numpy
+    buf = np.frombuffer(data, np.uint8)
+    width = data.find(b'\n', *spans[0]) + 1 - spans[0][0] if spans else 0
+    if width <= 0:
+        return [np.fromstring(data[start:end], sep=' ')
+                for start, end in spans]
+
+    counts = []
+    for start, end in spans:
+        count = (end - start) // width
+        broken = np.flatnonzero(
+            buf[start + width - 1:start + count * width:width] != 10)
+        counts.append(broken[0] if len(broken) else count)
+
+    lines = np.concatenate([buf[start:start + count * width] for (
+        start, end), count in zip(spans, counts)] + [buf[:0]])
+    values = ParseFixed(lines.reshape(-1, width)) if len(lines) else None
+    if values is None:
+        return [np.fromstring(data[start:end], sep=' ')
+                for start, end in spans]
+
+    values = np.split(values, np.cumsum(counts)[:-1])
+    return [np.append(value, np.fromstring(
+        data[start + count * width:end], sep=' '))
+        for value, (start, end), count in zip(values, spans, counts)]
+
+
+class Sparse:
+    # compressed sparse columns, the layout of scipy.sparse.csc_matrix:
+    # column j holds data[indptr[j]:indptr[j + 1]] in the rows
+    # indices[indptr[j]:indptr[j + 1]]
+
+    def __init__(self, shape, indptr, indices, data):
+        self.shape = shape
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @classmethod
+    def FromPairs(cls, shape, rows, cols, values):
+        # entries in any order, the order inside a column is kept
+        index = np.argsort(cols, kind='stable')
+        indptr = np.zeros(shape[1] + 1, dtype=np.intp)
+        np.cumsum(np.bincount(cols, minlength=shape[1]), out=indptr[1:])
+        return cls(shape, indptr, rows[index], values[index])
+
+    @classmethod
+    def FromDense(cls, matrix):
+        cols, rows = np.nonzero(matrix.T)
+        return cls(matrix.shape, np.searchsorted(
+            cols, np.arange(matrix.shape[1] + 1)), rows, matrix[rows, cols])
+
+    def ToDense(self):
+        matrix = np.zeros(self.shape)
+        cols = np.repeat(np.arange(self.shape[1]), np.diff(self.indptr))
+        matrix[self.indices, cols] = self.data
+        return matrix
+
+    def Drop(self, threshold):
+        # the entries of magnitude threshold and above
+        keep = np.abs(self.data) >= threshold
+        cols = np.repeat(np.arange(self.shape[1]), np.diff(self.indptr))
+        indptr = np.zeros(self.shape[1] + 1, dtype=np.intp)
+        np.cumsum(np.bincount(cols[keep], minlength=self.shape[1]),
+                  out=indptr[1:])
+        return Sparse(self.shape, indptr, self.indices[keep], self.data[keep])
+
+    def Permute(self, order):
+        # row i of the result is row order[i], only the row indices move;
+        # the rows of every column are sorted again
+        inverse = np.empty(len(order), dtype=np.intp)
+        inverse[order] = np.arange(len(order))
+        rows = inverse[self.indices]
+        cols = np.repeat(np.arange(self.shape[1]), np.diff(self.indptr))
+        index = np.lexsort((rows, cols))
+        return Sparse(self.shape, self.indptr, rows[index], self.data[index])
+
+
+def ReadOrb(filename, n, sparse=False):
+    with Open(filename) as file:
+        data = file.read()
+
+    # the count line is followed by one block per orbital:
+    # '# ORBITAL <col> ...' and then 'value index' pairs
+    cols = []
+    spans = []
+    start = data.find(b'# ORBITAL')
+    while start >= 0:
+        end = data.find(b'# ORBITAL', start + 1)
+        eol = data.find(b'\n', start)
+        eol = len(data) if eol < 0 else eol + 1
+        cols.append(int(data[start:eol].split()[2]) - 1)
+        spans.append((eol, len(data) if end < 0 else max(end, eol)))
+        start = end
+
+    # only the orbitals in the file get a column: the count line holds the
+    # number of coefficients of every orbital
+    header = data[:data.find(b'\n') + 1 or len(data)]
+    m = max([len(header.split()) if not header.startswith(b'#') else 0] +
+            [col + 1 for col in cols])
+
+    numbers = ParseNumbers(data, spans)
+    if sparse:
+        pairs = np.concatenate(numbers + [np.empty(0)])
+        cols = np.repeat(cols, [len(p) // 2 for p in numbers])
+        return Sparse.FromPairs((n, m), pairs[1::2].astype(np.intp) - 1,
+                                cols.astype(np.intp), pairs[0::2])
+
+    matrix = np.zeros((n, m))
+    for col, pairs in zip(cols, numbers):
+        matrix[pairs[1::2].astype(np.intp) - 1, col] = pairs[0::2]
+
+    return matrix
+
+
+def IterOrb(filename, n):
+    # the orbitals of a .orb one '# ORBITAL' block at a time, for
+    # conversions that never hold the whole matrix: first the number of
+    # orbitals on the count line, then (column, coefficients) pairs
+    with Open(filename) as file:
+        header = file.readline()
+        yield len(header.split()) if not header.startswith(b'#') else 0
+
+        col = None
+        if header.startswith(b'# ORBITAL'):
+            col = int(header.split()[2]) - 1
+        block = []
+        for line in file:
+            if line.startswith(b'# ORBITAL'):
+                if col is not None:
+                    yield col, Vector(b''.join(block), n)
+                col = int(line.split()[2]) - 1
+                block = []
+            else:
+                block.append(line)
+        if col is not None:
+            yield col, Vector(b''.join(block), n)
+
+
+def Vector(data, n):
+    vector = np.zeros(n)
+    pairs = ParseNumbers(data, [(0, len(data))])[0]
+    vector[pairs[1::2].astype(np.intp) - 1] = pairs[0::2]
+    return vector
+
+
+def ReadOrbGus(filename, n, sparse=False):
+    with Open(filename) as file:
+        data = file.read()
+
+    start = data.find(b' --------------Initial Guess--------------')
+    if start < 0:
+        empty = np.empty(0, dtype=np.intp)
+        return Sparse.FromPairs((n, 0), empty, empty, np.empty(0)) \
+            if sparse else np.zeros((n, 0))
+    start = data.find(b'\n', start) + 1 or len(data)
+    end = data.find(b' --------------End of Guess--------------', start)
+    end = len(data) if end < 0 else end
+
+    # the guess starts with the number of coefficients of every orbital,
+    # then all 'value index' pairs follow orbital after orbital
+    counts = []
+    while start < end:
+        eol = data.find(b'\n', start, end) + 1 or end
+        parts = data[start:eol].split()
+        if parts and b'.' in parts[0]:
+            break
+        counts.extend(int(item) for item in parts)
+        start = eol
+
+    pairs = ParseNumbers(data, [(start, end)])[0].reshape(-1, 2)
+    cols = np.repeat(np.arange(len(counts)), counts)[:len(pairs)]
+    pairs = pairs[:len(cols)]
+    if sparse:
+        return Sparse.FromPairs((n, len(counts)),
+                                pairs[:, 1].astype(np.intp) - 1,
+                                cols, pairs[:, 0])
+
+    matrix = np.zeros((n, len(counts)))
+    matrix[pairs[:, 1].astype(np.intp) - 1, cols] = pairs[:, 0]
+
+    return matrix
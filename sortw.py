@@ -1,51 +1,218 @@
+import math
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-def sort_vb_weights(filename, type1='w'):
-    wei_type = {
-        'w': 'WEIGHTS OF STRUCTURES',
-        'l': 'Lowdin Weights',
-        'i': 'Inverse Weights',
-        'r': 'Renormalized Weights',
-        'c': 'COEFFICIENTS OF STRUCTURES',
-        'lc': 'LOWDIN ORTHOGONALIZED COEFFICIENTS OF STRUCTURES',
-    }
-    wei_type1 = wei_type[type1]
-    with open(f'{filename}.xmo', 'r') as file:
-        str_data = []
-        wei_start = False
-
-        for line in file:
-            if wei_type1 in line:
-                wei_start = True
-                next(file)
-                continue
-
-            if wei_start:
-                if line.strip() == '':
-                    break
-                parts = line.split()
-                if len(parts) > 1:
-                    weight = float(parts[1])
-                    num = int(parts[0])
-                    info = ''.join(f'{i:>4}' for i in parts[3:])
-                    str1 = (weight, num, info)
-                    str_data.append(str1)
-
-    str_data.sort(reverse=True, key=lambda x: x[0])
-
-    one = 0
-    for i in range(len(str_data)):
-        one += str_data[i][0]
-        print(
-            f'{i+1:>5}{str_data[i][1]:>5}{str_data[i][0]:^20.8f}{str_data[i][2]}'
-              )
+from cache import Cached
+from compress import Open
+from xmo import IndexXmo
+
+TABLES = ('w', 'l', 'i', 'r', 'c', 'lc')
+
+
+def read_table(file, offset):
+    # rows of the table whose header line starts at offset: structure
+    # number, value and the orbitals of the structure (parts[3:])
+    file.seek(offset)
+    file.readline()
+    file.readline()
+    nums = []
+    values = []
+    infos = []
+    for line in file:
+        parts = line.decode().split()
+        if not parts:
+            break
+        if len(parts) > 1:
+            nums.append(int(parts[0]))
+            values.append(float(parts[1]))
+            infos.append(parts[3:])
+    return nums, values, infos
+
+
+def read_tables(filename):
+    # every table of the .xmo, read in file order through one open file
+    # and joined by structure number; a structure missing from a table
+    # gets nan there
+    index = Cached(IndexXmo, f'{filename}.xmo')
+    found = sorted((index[t], t) for t in TABLES if t in index)
+    tables = {}
+    with Open(f'{filename}.xmo') as file:
+        for offset, type1 in found:
+            tables[type1] = read_table(file, offset)
+
+    nums = np.unique([num for t in tables.values() for num in t[0]])
+    columns = {'num': nums}
+    info = {}
+    for type1 in TABLES:
+        column = np.full(len(nums), np.nan)
+        if type1 in tables:
+            t_nums, values, infos = tables[type1]
+            column[np.searchsorted(nums, t_nums)] = values
+            for num, parts in zip(t_nums, infos):
+                info.setdefault(num, ' '.join(parts))
+        columns[type1] = column
+    columns['info'] = np.array([info[num] for num in nums.tolist()],
+                               dtype=str)
+    return columns
+
+
+def write_tables(filename, columns, fmt='npz'):
+    if fmt == 'npz':
+        np.savez(f'{filename}_weights.npz', **columns)
+        return f'{filename}_weights.npz'
+    with open(f'{filename}_weights.csv', 'w') as file:
+        file.write(','.join(columns) + '\n')
+        lines = []
+        for row in zip(*(columns[t].tolist() for t in ('num',) + TABLES),
+                       columns['info'].tolist()):
+            # nan, a structure missing from a table, is left empty
+            lines.append(','.join(
+                [str(row[0])] +
+                ['' if value != value else f'{value:.8f}'
+                 for value in row[1:-1]] + [row[-1]]) + '\n')
+        file.write(''.join(lines))
+    return f'{filename}_weights.csv'
+
+
+def select(weights, top=None, min_weight=None):
+    # rows to print, largest weight first; only the selected rows are
+    # sorted, np.argpartition picks the top ones
+    index = np.arange(len(weights))
+    if min_weight is not None:
+        index = index[weights >= min_weight]
+    if top is not None and top < len(index):
+        index = index[np.argpartition(-weights[index], top - 1)[:top]]
+    return index[np.argsort(-weights[index], kind='stable')]
+
+
+def print_sorted(weights, nums, infos, top=None, min_weight=None):
+    weights = np.asarray(weights, dtype=float)
+    index = select(weights, top, min_weight)
+    if top is None and min_weight is None:
+        # summed in the printed order, as it always has been
+        one = sum(weights[index].tolist())
+    else:
+        # still the sum over all structures, not only the printed ones
+        one = math.fsum(weights.tolist())
+
+    if len(index):
+        print('\n'.join(
+            f'{i+1:>5}{nums[k]:>5}{weights[k]:^20.8f}'
+            + ''.join(f'{j:>4}' for j in infos[k])
+            for i, k in enumerate(index.tolist())))
     print(one)
 
 
+def sort_vb_weights(filename, type1='w', top=None, min_weight=None):
+    # w: WEIGHTS OF STRUCTURES, l: Lowdin Weights, i: Inverse Weights,
+    # r: Renormalized Weights, c: COEFFICIENTS OF STRUCTURES,
+    # lc: LOWDIN ORTHOGONALIZED COEFFICIENTS OF STRUCTURES
+    if type1 not in TABLES:
+        raise KeyError(type1)
+    # seek straight to the table, the section index is kept by the .npz
+    # cache when XMVB_CACHE is set
+    index = Cached(IndexXmo, f'{filename}.xmo')
+    nums, values, infos = [], [], []
+    if type1 in index:
+        with Open(f'{filename}.xmo') as file:
+            nums, values, infos = read_table(file, index[type1])
+
+    print_sorted(values, nums, infos, top, min_weight)
+
+
+def read_weights(filename, type1='w'):
+    # one table of one job as arrays, run in the worker processes of
+    # compare; the orbitals of every structure are joined into one string
+    index = Cached(IndexXmo, f'{filename}.xmo')
+    nums, values, infos = [], [], []
+    if type1 in index:
+        with Open(f'{filename}.xmo') as file:
+            nums, values, infos = read_table(file, index[type1])
+    return (np.array(nums, dtype=int),
+            np.array([' '.join(parts) for parts in infos], dtype=str),
+            np.array(values, dtype=float))
+
+
+def compare(filenames, type1='w', sort=None, workers=None):
+    # one table of many jobs, parsed in parallel; structures are matched
+    # by number and by their orbitals, one row each, one column per job
+    with ProcessPoolExecutor(workers) as pool:
+        tables = list(pool.map(read_weights, filenames,
+                               [type1] * len(filenames)))
+
+    # the orbitals are numbered once, so that a structure is one integer
+    infos, info = np.unique(np.concatenate([t[1] for t in tables]),
+                            return_inverse=True)
+    keys, rows = np.unique(np.concatenate([t[0] for t in tables]) *
+                           len(infos) + info, return_inverse=True)
+    matrix = np.full((len(keys), len(filenames)), np.nan)
+    cols = np.repeat(np.arange(len(tables)), [len(t[2]) for t in tables])
+    matrix[rows, cols] = np.concatenate([t[2] for t in tables])
+    nums = keys // max(len(infos), 1)
+    infos = infos[keys % max(len(infos), 1)]
+
+    order = np.arange(len(keys))
+    if sort == 'max':
+        order = np.argsort(-np.nanmax(matrix, axis=1), kind='stable')
+    elif sort == 'mean':
+        order = np.argsort(-np.nanmean(matrix, axis=1), kind='stable')
+
+    # one format string per row; a structure missing from a job is left
+    # blank
+    widths = [max(14, len(name) + 2) for name in filenames]
+    line = '%5d' + ''.join(f'%{w}.8f' for w in widths) + '  %s\n'
+    text = ''.join(line % (num, *values, ''.join(
+        f'{j:>4}' for j in info.split()))
+        for num, info, values in zip(nums[order].tolist(),
+                                     infos[order].tolist(),
+                                     matrix[order].tolist()))
+    for w in set(widths):
+        text = text.replace(' ' * (w - 3) + 'nan', ' ' * w)
+    print(f'{"num":>5}' + ''.join(
+        f'{name:>{w}}' for name, w in zip(filenames, widths)))
+    print(text, end='')
+    return nums, infos, matrix
+
+
 if __name__ == '__main__':
 
-    if len(sys.argv) > 2:
-        sort_vb_weights(sys.argv[1], sys.argv[2])
+    # --top K prints the K largest, --min-weight W those of at least W
+    args = sys.argv[1:]
+    options = {}
+    for name, kind in (('--top', int), ('--min-weight', float)):
+        if name in args:
+            k = args.index(name)
+            options[name] = kind(args[k + 1])
+            del args[k:k + 2]
+    top = options.get('--top')
+    min_weight = options.get('--min-weight')
+    if top is not None and top < 1:
+        raise ValueError(f'--top needs a positive number, not {top}')
+
+    if args and args[0] == '--compare':
+        # --compare <files> [--type t] [--sort max|mean] [-j workers]
+        for name in ('--type', '--sort', '-j'):
+            if name in args:
+                k = args.index(name)
+                options[name] = args[k + 1]
+                del args[k:k + 2]
+        compare([f[:-4] if f.endswith('.xmo') else f for f in args[1:]],
+                options.get('--type', 'w'), options.get('--sort'),
+                int(options['-j']) if '-j' in options else None)
+    elif len(args) > 1 and args[1] == 'all':
+        # all tables in one pass: the weights are printed sorted and every
+        # table is written as columns to <file>_weights.npz or .csv
+        columns = read_tables(args[0])
+        found = columns['w'] == columns['w']
+        print_sorted(columns['w'][found], columns['num'][found].tolist(),
+                     [info.split() for info in columns['info'][found]],
+                     top, min_weight)
+        print(write_tables(args[0], columns,
+                           args[2] if len(args) > 2 else 'npz'),
+              'has been written')
+    elif len(args) > 1:
+        sort_vb_weights(args[0], args[1], top, min_weight)
     else:
-        sort_vb_weights(sys.argv[1])
+        sort_vb_weights(args[0], top=top, min_weight=min_weight)
@@ -1,220 +1,105 @@
-import re
 import sys
 
 import numpy as np
 
-
-def ReadNxmo(filename):
-    with open(filename, 'r') as file:
-        for line in file:
-            if line.startswith(' NUMBER OF CARTESIAN GAUSSIAN BASIS FUNCTIONS'):
-                n = int(line.split()[7])
-                break
-    return n
-
-
-def ReadGEOxmo(filename):
-    with open(filename, 'r') as file:
-        geo = []
-        GEO_start = False
-        count = 0
-        for line in file:
-            parts = line.split()
-            if parts == ['CHARGE', 'X', 'Y', 'Z']:
-                GEO_start = True
-                continue
-            elif GEO_start:
-                if parts:
-                    count += 1
-                    geo.append(f'{parts[0]}{count:>6}' + ''.join(
-                        f'{float(j):>15.8f}' for j in parts[1:5]) + '\n')
-                else:
-                    break
-    return ''.join(geo)
-
-
-def ReadOrb(filename, n):
-    matrix = np.zeros((n, n))
-
-    with open(filename, 'r') as file:
-
-        next(file)
-        col = None
-        for line in file:
-
-            if line.startswith("# ORBITAL"):
-                parts = line.split()
-                col = int(parts[2]) - 1
-            elif col is not None:
-                values = line.split()
-                for i in range(0, len(values), 2):
-                    value = float(values[i])
-                    row = int(values[i + 1]) - 1
-                    matrix[row, col] = value
-
-    return matrix
-
-
-def ReadOrbGus(filename, n):
-    matrix = np.zeros((n, n))
-    num_start = False
-    item_start = False
-    count1 = 0
-    with open(filename, 'r') as file:
-        c = []
-        for line in file:
-            if line.startswith(' --------------End of Guess--------------'):
-                break
-            if line.startswith(' --------------Initial Guess--------------'):
-                num_start = True
-                continue
-            if num_start:
-                parts = line.split()
-                if '.' not in parts[0]:
-                    c.append(line.split())
-                else:
-                    if not item_start:
-                        c1 = [int(item) for row in c for item in row]
-                        column_ends = np.cumsum(c1)
-                        item_start = True
-                    for i in range(0, len(parts), 2):
-                        value = float(parts[i])
-                        row = int(parts[i + 1]) - 1
-                        for col_index, end in enumerate(column_ends):
-                            if count1 < end:
-                                matrix[row, col_index] = value
-                                break
-                        count1 += 1
-
-    return matrix
-
-
-def ChangeD(matrix, i):
-    temp = matrix[i + 1:i + 6, :].copy()
-    matrix[i + 1, :] = temp[2, :]  # XY 0  YY i+1
-    matrix[i + 2, :] = temp[4, :]  # XZ 1  ZZ
-    matrix[i + 3, :] = temp[0, :]  # YY 2  XY
-    matrix[i + 4, :] = temp[1, :]  # YZ 3  XZ
-    matrix[i + 5, :] = temp[3, :]  # ZZ 4  YZ
-    return matrix
-
-
-def ChangeF(matrix, i):
-    temp = matrix[i + 1:i + 10, :].copy()
-    matrix[i + 1, :] = temp[5, :]  # XXY 0  YYY i+1
-    matrix[i + 2, :] = temp[8, :]  # XXZ 1  ZZZ
-    # XYY 2  XYY
-    matrix[i + 4, :] = temp[0, :]  # XYZ 3  XXY
-    matrix[i + 5, :] = temp[1, :]  # XZZ 4  XXZ
-    matrix[i + 6, :] = temp[4, :]  # YYY 5  XZZ
-    matrix[i + 7, :] = temp[7, :]  # YYZ 6  YZZ
-    matrix[i + 8, :] = temp[6, :]  # YZZ 7  YYZ
-    matrix[i + 9, :] = temp[3, :]  # ZZZ 8  XYZ
-    return matrix
-
-
-def ReadBasis(filename, matrix):
-    atom_pattern = re.compile(r'\b[A-Z][A-Z]?\b')
-    output = []
-    count1 = 0
-    atom_index = 0
-    basis_start = False
-
-    with open(filename, 'r') as file:
-        for line in file:
-            line = line.strip()
-
-            if 'TOTAL NUMBER' in line:
-                break
-
-            if 'SHELL TYPE' in line:
-                basis_start = True
-                next(file)
-                continue
-
-            if basis_start:
-                if atom_pattern.match(line):
-                    atom_index += 1
-                    output.append(f'\n{atom_index}  0\n')
-                    continue
-
-                if line:
-                    parts = line.split()
-                    orbital_type = parts[1]
-                    coefficient = []
-                    count = 0
-                    if orbital_type == 'L':
-                        count1 += 4
-                        coefficient_s = []
-                        coefficient_p = []
-                        while line and line.strip():
-                            parts = line.split()
-                            coefficient_s.append(
-                                f'  {parts[3]:>14}    {parts[4]:>16}')
-                            coefficient_p.append(
-                                f'  {parts[3]:>14}    {parts[5]:>16}')
-                            count += 1
-                            line = next(file).strip()
-
-                        output.append(f'S {count} 1.0\n' + ''.join(
-                            f'{info}\n' for info in coefficient_s))
-                        output.append(f'P {count} 1.0\n' + ''.join(
-                            f'{info}\n' for info in coefficient_p))
-                    else:
-                        if orbital_type == 'S':
-                            count1 += 1
-                        elif orbital_type == 'P':
-                            count1 += 3
-                        elif orbital_type == 'D':
-                            ChangeD(matrix, count1)
-                            count1 += 6
-                        elif orbital_type == 'F':
-                            ChangeF(matrix, count1)
-                            count1 += 10
-                        while line and line.strip():
-                            parts = line.split()
-                            coefficient.append(
-                                f'  {parts[3]:>14}    {parts[4]:>16}')
-                            count += 1
-                            line = next(file).strip()
-
-                        output.append(f'{orbital_type} {count} 1.0\n' + ''.join(
-                            f'{info}\n' for info in coefficient))
-
-    return ''.join(output), matrix
-
-
-def WriteMolden(file, file2):
-    n = ReadNxmo(f'{file2}.xmo')
-
-    matrix = ReadOrb(f'{file}.orb', n)
-    # matrix = ChangeBasis(matrix, 'INFO')
-
-    basis, matrix = ReadBasis(f'{file2}.xmo', matrix)
-
-    geo = ReadGEOxmo(f'{file2}.xmo')
-
-    with open(f'{file}.molden', 'w') as mol:
-        mol.write('''[Molden Format]
-[Title]
-qaq
-[Atoms] AU
-''')
-        mol.write(geo)
-        mol.write('[GTO]')
-        mol.write(basis)
-        mol.write('\n' * 3)
-        mol.write('''[6D10F]\n[MO]\n''')
-        for i in range(n):
-            mol.write('''Sym=     1a
-Ene= 1.0
-Spin= Alpha
-Occup= 2.000000
-''')
-            for j in range(n):
-                mol.write(f'{j+1:>4}  {matrix[j,i]:>15.10f}\n')
+from cache import Cached
+from compress import Create
+from gto import CheckNorms, MoldenComponents, Norms, Shells
+from molden import WriteHeader, WriteMO, WriteMOSparse, WriteMOStream
+from orb import IterOrb, ReadOrb
+from xmo import ReadXmo
+
+
+def WriteMolden(file, file2, sparse=False, square=False, check=True,
+                drop=0.0, compact=False, compress=None):
+    xmo = Cached(ReadXmo, f'{file2}.xmo')
+    n = xmo.n
+
+    matrix = Cached(ReadOrb, f'{file}.orb', n, sparse)
+
+    # --compress gz|zst writes <file>.molden.gz or .zst
+    with Create(f'{file}.molden', compress) as mol:
+        WriteHeader(mol, xmo)
+        # --sparse lists only the nonzero AOs of every orbital, --square
+        # adds empty orbitals up to the number of basis functions,
+        # --drop-below leaves out the smaller AOs and --compact shortens
+        # the numbers
+        pad = n - matrix.shape[1] if square else 0
+        if sparse:
+            WriteMOSparse(mol, matrix, order=xmo.order, pad=pad, drop=drop,
+                          compact=compact)
+        else:
+            WriteMO(mol, matrix, order=xmo.order, pad=pad, drop=drop,
+                    compact=compact)
+
+    # diag(C^T S C) of the orbitals as written, in Molden order against
+    # the Molden components, --nocheck skips it
+    if check:
+        CheckNorms(f'{file}.molden', Norms(Shells(xmo), matrix, xmo.order,
+                                           MoldenComponents))
+
+
+def Checked(columns, shells, order, norms):
+    # passes the streamed orbitals on, keeping the norm of every one; the
+    # orbitals are checked in chunks of about 2**22 numbers, one Norms call
+    # per chunk
+    size = max(2 ** 22 // len(order), 1)
+    chunk = []
+    for col, vector in columns:
+        chunk.append((col, vector))
+        if len(chunk) == size:
+            Flush(chunk, shells, order, norms)
+        yield col, vector
+    Flush(chunk, shells, order, norms)
+
+
+def Flush(chunk, shells, order, norms):
+    if chunk:
+        cols, vectors = zip(*chunk)
+        norms.update(zip(cols, Norms(shells, np.column_stack(vectors),
+                                     order, MoldenComponents)))
+        chunk.clear()
+
+
+def WriteMoldenStream(file, file2, square=False, check=False, drop=0.0,
+                      compact=False, compress=None):
+    # --stream: one orbital in memory at a time, for very large jobs; the
+    # norm check keeps a chunk of orbitals and is only done with --check
+    xmo = Cached(ReadXmo, f'{file2}.xmo')
+    n = xmo.n
+
+    columns = IterOrb(f'{file}.orb', n)
+    m = next(columns)
+    norms = {}
+    if check:
+        columns = Checked(columns, Shells(xmo), xmo.order, norms)
+
+    with Create(f'{file}.molden', compress) as mol:
+        WriteHeader(mol, xmo)
+        WriteMOStream(mol, columns, n, xmo.order, max(m, n) if square else m,
+                      drop, compact)
+
+    if check:
+        total = np.zeros(max(norms, default=-1) + 1)
+        total[list(norms)] = list(norms.values())
+        CheckNorms(f'{file}.molden', total)
 
 
 if __name__ == "__main__":
 
-    WriteMolden(sys.argv[1], sys.argv[2])
+    args = sys.argv[3:]
+    # the norm check is on by default except with --stream and --sparse,
+    # --check turns it on there
+    check = '--nocheck' not in args and ('--check' in args or not (
+        '--stream' in args or '--sparse' in args))
+    drop = float(args[args.index('--drop-below') + 1]) \
+        if '--drop-below' in args else 0.0
+    compress = args[args.index('--compress') + 1] \
+        if '--compress' in args else None
+    if '--stream' in args:
+        WriteMoldenStream(sys.argv[1], sys.argv[2], '--square' in args,
+                          check, drop, '--compact' in args, compress)
+    else:
+        WriteMolden(sys.argv[1], sys.argv[2], '--sparse' in args,
+                    '--square' in args, check, drop, '--compact' in args,
+                    compress)
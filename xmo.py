@@ -0,0 +1,233 @@
+import mmap
+import os
+import re
+
+from cart import MoldenOrder, ShellSizes
+from compress import Find, Kind, Open
+
+# text marking every section, the offset of the first line holding it is
+# kept by IndexXmo
+SECTIONS = {
+    'geo': b'CHARGE',
+    'basis': b'SHELL TYPE',
+    'n': b' NUMBER OF CARTESIAN GAUSSIAN BASIS FUNCTIONS',
+    'w': b'WEIGHTS OF STRUCTURES',
+    'l': b'Lowdin Weights',
+    'i': b'Inverse Weights',
+    'r': b'Renormalized Weights',
+    'c': b'COEFFICIENTS OF STRUCTURES',
+    'lc': b'LOWDIN ORTHOGONALIZED COEFFICIENTS OF STRUCTURES',
+}
+
+# the weight tables are found through a word their headers share; the
+# 'lc' header contains the 'c' one and is not taken for it
+ANCHORS = {'w': b'STRUCTURES', 'c': b'STRUCTURES', 'lc': b'STRUCTURES',
+           'l': b'Weights', 'i': b'Weights', 'r': b'Weights'}
+
+
+class Molecule:
+
+    def __init__(self):
+        self.natm = 0
+        self.n = 0
+        self.geo = ''
+        self.unit = 'AU'
+        self.basis = ''
+        self.shells = []
+        # nuclear charges and coordinates (bohr) of the atoms, and for
+        # every shell its (exponent, coefficient[, P coefficient]) rows
+        self.charges = []
+        self.coords = []
+        self.primitives = []
+        self.offsets = {}
+
+    @property
+    def order(self):
+        return MoldenOrder(tuple(t for _, t in self.shells))
+
+
+def Float(text):
+    return float(text.replace('D', 'E'))
+
+
+def ReadGEO(file, mol):
+    geo = []
+    for line in file:
+        parts = line.decode().split()
+        if not parts:
+            break
+        mol.natm += 1
+        mol.charges.append(float(parts[1]))
+        mol.coords.append([float(j) for j in parts[2:5]])
+        geo.append(f'{parts[0]}{mol.natm:>6}' + ''.join(
+            f'{float(j):>15.8f}' for j in parts[1:5]) + '\n')
+    mol.geo = ''.join(geo)
+
+
+def ReadBlock(lines):
+    # the shells of one atom: the [GTO] text, the shell types and the
+    # primitives; a blank line ends every shell
+    output = []
+    types = []
+    primitives = []
+    i = 0
+    while i < len(lines):
+        line = lines[i].decode().strip()
+        i += 1
+        if not line:
+            continue
+
+        orbital_type = line.split()[1]
+        types.append(orbital_type)
+        primitives.append([])
+        coefficient = []
+        count = 0
+        if orbital_type == 'L':
+            coefficient_s = []
+            coefficient_p = []
+            while line:
+                parts = line.split()
+                coefficient_s.append(f'  {parts[3]:>14}    {parts[4]:>16}')
+                coefficient_p.append(f'  {parts[3]:>14}    {parts[5]:>16}')
+                primitives[-1].append([Float(j) for j in parts[3:6]])
+                count += 1
+                line = lines[i].decode().strip() if i < len(lines) else ''
+                i += 1
+
+            output.append(f'S {count} 1.0\n' + ''.join(
+                f'{info}\n' for info in coefficient_s))
+            output.append(f'P {count} 1.0\n' + ''.join(
+                f'{info}\n' for info in coefficient_p))
+        else:
+            while line:
+                parts = line.split()
+                coefficient.append(f'  {parts[3]:>14}    {parts[4]:>16}')
+                primitives[-1].append([Float(j) for j in parts[3:5]])
+                count += 1
+                line = lines[i].decode().strip() if i < len(lines) else ''
+                i += 1
+
+            output.append(f'{orbital_type} {count} 1.0\n' + ''.join(
+                f'{info}\n' for info in coefficient))
+    return ''.join(output), types, primitives
+
+
+def ReadShells(file, mol):
+    # the lines of every atom are gathered first, keyed without the running
+    # shell and primitive numbers; atoms repeating the block of an earlier
+    # atom (the same element and basis) reuse its shells and [GTO] text
+    atom_pattern = re.compile(rb'\b[A-Z][A-Z]?\b')
+    blocks = []
+    for line in file:
+        if b'TOTAL NUMBER' in line:
+            break
+        parts = line.split(None, 3)
+        if parts and atom_pattern.match(parts[0]):
+            blocks.append(([], []))
+        elif blocks:
+            blocks[-1][0].append(line)
+            blocks[-1][1].append(
+                parts[1] + parts[3] if len(parts) == 4 else b'\n' + line)
+
+    output = []
+    parsed = {}
+    for atom_index, (lines, key) in enumerate(blocks, 1):
+        key = b''.join(key)
+        if key not in parsed:
+            parsed[key] = ReadBlock(lines)
+        text, types, primitives = parsed[key]
+        output.append(f'\n{atom_index}  0\n' + text)
+        mol.shells.extend((atom_index, t) for t in types)
+        mol.primitives.extend(primitives)
+
+    mol.basis = ''.join(output)
+
+
+def Scan(data, base, groups, index):
+    # the sections found in data, a run of whole lines starting at byte
+    # base of the file; found names leave their group
+    for anchor, names in groups.items():
+        pos = data.find(anchor) if names else -1
+        while pos >= 0:
+            start = data.rfind(b'\n', 0, pos) + 1
+            end = data.find(b'\n', pos)
+            end = len(data) if end < 0 else end
+            line = data[start:end]
+            for name in names[:]:
+                if SECTIONS[name] not in line or \
+                        name == 'geo' and line.split() != [
+                            b'CHARGE', b'X', b'Y', b'Z'] or \
+                        name == 'n' and not line.startswith(
+                            SECTIONS[name]) or \
+                        name == 'c' and SECTIONS['lc'] in line:
+                    continue
+                index[name] = base + start
+                names.remove(name)
+            pos = data.find(anchor, end) if names else -1
+
+
+def IndexXmo(filename, names=tuple(SECTIONS)):
+    # byte offset of the header line of every section, found by searching
+    # the mapped file instead of checking it line by line; sections sharing
+    # an anchor word are found in the same search. Compressed files are
+    # searched block by block as they are decompressed, the offsets count
+    # decompressed bytes
+    groups = {}
+    for name in names:
+        pattern = SECTIONS[name]
+        groups.setdefault(ANCHORS.get(name, pattern), []).append(name)
+
+    index = {}
+    filename = Find(filename)
+    if Kind(filename) is None:
+        with open(filename, 'rb') as file:
+            if not os.fstat(file.fileno()).st_size:
+                return index
+            with mmap.mmap(file.fileno(), 0,
+                           access=mmap.ACCESS_READ) as data:
+                Scan(data, 0, groups, index)
+        return index
+
+    with Open(filename) as file:
+        base = 0
+        rest = b''
+        for block in iter(lambda: file.read(1 << 24), b''):
+            data = rest + block
+            cut = data.rfind(b'\n') + 1
+            Scan(data[:cut], base, groups, index)
+            if not any(groups.values()):
+                return index
+            rest = data[cut:]
+            base += cut
+        Scan(rest, base, groups, index)
+    return index
+
+
+def ReadXmo(filename):
+    # the geometry, the basis and the number of basis functions are read
+    # straight from their offsets
+    mol = Molecule()
+    index = IndexXmo(filename, ('geo', 'basis', 'n'))
+    # sections in file order, compressed files only seek forward
+    with Open(filename) as file:
+        for offset, name in sorted((offset, name)
+                                   for name, offset in index.items()):
+            file.seek(offset)
+            if name == 'geo':
+                file.readline()
+                mol.offsets['geo'] = file.tell()
+                ReadGEO(file, mol)
+            elif name == 'basis':
+                file.readline()
+                file.readline()
+                mol.offsets['basis'] = file.tell()
+                ReadShells(file, mol)
+            else:
+                mol.offsets['n'] = offset
+                mol.n = int(file.readline().split()[7])
+
+    count = sum(ShellSizes(t for _, t in mol.shells))
+    if mol.n and count != mol.n:
+        raise ValueError(
+            f'{filename}: shells hold {count} basis functions, expected {mol.n}')
+    return mol